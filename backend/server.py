@@ -1,7 +1,8 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
@@ -19,6 +20,12 @@ import base64
 import google.generativeai as genai
 import json
 import asyncio
+import time
+import hashlib
+import tempfile
+import queue
+import threading
+from collections import OrderedDict
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -56,6 +63,9 @@ app = FastAPI()
 # In-memory cache for analyses (when MongoDB is not available)
 analysis_cache = {}
 
+# In-memory timeline sprite sheets ({"data", "format"}), keyed by video id (when MongoDB is not available)
+sprite_cache = {}
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -72,11 +82,22 @@ class VideoAnalysis(BaseModel):
 
 class StoryGenerationRequest(BaseModel):
     analysis_id: str
+    style: Optional[str] = None
+    regenerate: bool = False
 
 class StoryResponse(BaseModel):
     story: str
     analysis_id: str
 
+class UploadSessionRequest(BaseModel):
+    filename: str
+    content_type: str
+    total_size: int
+    mode: str = "sampled"
+
+class FinalizeUploadRequest(BaseModel):
+    sha256: Optional[str] = None
+
 # Mudra Classification (simplified rule-based)
 def classify_mudra(hand_landmarks):
     """Basic mudra classification based on hand landmarks"""
@@ -123,8 +144,210 @@ def classify_emotion(face_landmarks):
     else:
         return "Serenity (Shanta)"
 
-def analyze_video_frames(video_path: str, max_frames: int = 50):
-    """Process video and extract pose, gesture, and expression data using basic video analysis"""
+# Frame sampling modes for analyze_video_frames
+ANALYSIS_MODES = ("sampled", "tracking")
+TRACKING_WINDOW_FRAMES = max(1, int(os.environ.get('TRACKING_WINDOW_FRAMES', '10')))
+# Tracking is cheaper per frame, so it gets a larger budget to cover as much of the performance as sampling does
+MAX_FRAMES = {
+    "sampled": 50,
+    "tracking": max(1, int(os.environ.get('TRACKING_MAX_FRAMES', '300'))),
+}
+SCENE_CUT_THRESHOLD = 0.5  # Bhattacharyya distance between consecutive frame histograms
+
+def select_frame_indices(total_frames: int, max_frames: int, mode: str = "sampled", window_size: int = TRACKING_WINDOW_FRAMES):
+    """Pick frames to analyze: evenly spaced samples, or evenly spaced contiguous windows in tracking mode"""
+    count = min(max_frames, total_frames)
+    if mode != "tracking":
+        return np.linspace(0, total_frames - 1, count, dtype=int)
+    
+    window_size = max(1, min(window_size, count))
+    num_windows = -(-count // window_size)
+    starts = np.linspace(0, total_frames - window_size, num_windows, dtype=int)
+    indices = sorted({int(start) + offset for start in starts for offset in range(window_size)})
+    return np.array(indices[:count], dtype=int)
+
+def frame_histogram(frame):
+    """Small hue/saturation histogram used for scene cut detection"""
+    small = cv2.resize(frame, (64, 64), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+    cv2.normalize(hist, hist)
+    return hist
+
+def is_scene_cut(prev_hist, hist) -> bool:
+    """Detect a hard cut between two consecutive frames"""
+    if prev_hist is None:
+        return False
+    return cv2.compareHist(prev_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > SCENE_CUT_THRESHOLD
+
+def build_inference_stats(mode: str, engine: str, frames_processed: int, inference_seconds: Optional[float],
+                          detections: Optional[Dict[str, int]], reseeds: int) -> Dict[str, Any]:
+    """Summarise per-frame cost and detection rate so the sampling modes can be compared
+    
+    Cost and detection rate are None when no model ran (the fallback engine), so they don't skew comparisons.
+    """
+    avg_ms_per_frame = None
+    if inference_seconds is not None:
+        avg_ms_per_frame = round(inference_seconds * 1000 / frames_processed, 2) if frames_processed else 0
+    
+    detection_rate = None
+    if detections is not None:
+        detection_rate = {
+            name: round(count / frames_processed, 3) if frames_processed else 0
+            for name, count in detections.items()
+        }
+    
+    return {
+        "mode": mode,
+        "engine": engine,
+        "frames_processed": frames_processed,
+        "avg_ms_per_frame": avg_ms_per_frame,
+        "detection_rate": detection_rate,
+        "reseeds": reseeds
+    }
+
+def downscale_frame(frame, max_width: Optional[int], out=None):
+    """Shrink a frame to max_width (keeping aspect ratio) before inference, reusing out when it fits"""
+    if not max_width or frame.shape[1] <= max_width:
+        return frame
+    height = int(frame.shape[0] * max_width / frame.shape[1])
+    return cv2.resize(frame, (max_width, height), dst=out, interpolation=cv2.INTER_AREA)
+
+# Timeline thumbnails - tiles are cut from frames already decoded for analysis and packed into one sprite sheet
+THUMBNAIL_WIDTH = 160
+THUMBNAIL_COLUMNS = 10
+THUMBNAIL_MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'jpeg').strip().lower()
+if THUMBNAIL_FORMAT not in THUMBNAIL_MEDIA_TYPES:
+    THUMBNAIL_FORMAT = "jpeg"
+THUMBNAIL_QUALITY = 70
+
+def capture_thumbnail(thumbnails: Optional[Dict[int, Any]], frame_num: int, frame):
+    """Keep a small copy of a decoded frame for the sprite sheet"""
+    if thumbnails is None:
+        return
+    height = max(1, round(THUMBNAIL_WIDTH * frame.shape[0] / frame.shape[1]))
+    thumbnails[int(frame_num)] = cv2.resize(frame, (THUMBNAIL_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+def build_sprite_sheet(video_id: str, analysis_data: Dict[str, Any], thumbnails: Dict[int, Any]) -> Optional[bytes]:
+    """Pack scene thumbnails into one image and record each scene's offset in the analysis"""
+    scenes = [scene for scene in analysis_data["scenes"] if scene["frame_number"] in thumbnails]
+    if not scenes:
+        return None
+    
+    tile_height, tile_width = thumbnails[scenes[0]["frame_number"]].shape[:2]
+    columns = min(THUMBNAIL_COLUMNS, len(scenes))
+    rows = -(-len(scenes) // columns)
+    sheet = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+    
+    for i, scene in enumerate(scenes):
+        x, y = (i % columns) * tile_width, (i // columns) * tile_height
+        sheet[y:y + tile_height, x:x + tile_width] = thumbnails[scene["frame_number"]]
+        scene["thumbnail"] = {"x": x, "y": y}
+    
+    if THUMBNAIL_FORMAT == "webp":
+        ok, encoded = cv2.imencode(".webp", sheet, [cv2.IMWRITE_WEBP_QUALITY, THUMBNAIL_QUALITY])
+    else:
+        ok, encoded = cv2.imencode(".jpg", sheet, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    if not ok:
+        return None
+    
+    analysis_data["sprite"] = {
+        "url": f"/api/analysis/{video_id}/sprite",
+        "format": THUMBNAIL_FORMAT,
+        "tile_width": tile_width,
+        "tile_height": tile_height,
+        "columns": columns,
+        "rows": rows
+    }
+    return encoded.tobytes()
+
+# Analysis pipeline - decode, inference and classification run as concurrent stages joined by bounded queues
+PIPELINE_QUEUE_DEPTH = max(1, int(os.environ.get('PIPELINE_QUEUE_DEPTH', '4')))
+PIPELINE_POLL_SECONDS = 0.1
+_PIPELINE_DONE = object()
+
+def pipeline_get(q: queue.Queue, stop: threading.Event):
+    """Blocking get that gives up (returning the done marker) once another stage has failed"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=PIPELINE_POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return _PIPELINE_DONE
+
+def pipeline_put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once another stage has failed"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=PIPELINE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+class PipelineMonitor:
+    """Busy time per stage and occupancy per queue, reported so queue depth can be tuned
+    
+    Each stage only writes its own entries, so no locking is needed.
+    """
+    
+    def __init__(self, stages, queues):
+        self.started = time.perf_counter()
+        self.busy = {stage: 0.0 for stage in stages}
+        self.occupancy = {name: [] for name in queues}
+    
+    def add_busy(self, stage: str, seconds: float):
+        self.busy[stage] += seconds
+    
+    def sample(self, name: str, q: queue.Queue):
+        self.occupancy[name].append(q.qsize())
+    
+    def snapshot(self) -> Dict[str, Any]:
+        wall_seconds = time.perf_counter() - self.started
+        return {
+            "queue_depth": PIPELINE_QUEUE_DEPTH,
+            "wall_seconds": round(wall_seconds, 3),
+            "stages": {
+                stage: {
+                    "busy_seconds": round(busy, 3),
+                    "utilization": round(busy / wall_seconds, 3) if wall_seconds else 0
+                }
+                for stage, busy in self.busy.items()
+            },
+            "queues": {
+                name: {
+                    "avg_occupancy": round(sum(samples) / len(samples), 2) if samples else 0,
+                    "max_occupancy": max(samples, default=0)
+                }
+                for name, samples in self.occupancy.items()
+            }
+        }
+
+def describe_scene(timestamp: float, action: str, mudra: Optional[str], emotion: Optional[str]) -> str:
+    """One-line interpretation of a scene; mudra and emotion are None when they weren't analyzed"""
+    text = f"At {round(timestamp, 1)}s: Performer"
+    text += f" displays {emotion} through {action}" if emotion else f" shows {action}"
+    if mudra:
+        text += f", forming {mudra} mudra"
+    return text
+
+def analyze_video_frames(video_path: str, max_frames: Optional[int] = None, mode: str = "sampled",
+                         pose_only: bool = False, max_width: Optional[int] = None,
+                         thumbnails: Optional[Dict[int, Any]] = None):
+    """Process video and extract pose, gesture, and expression data using basic video analysis
+    
+    In "sampled" mode frames are spread evenly across the video and each one runs full detection.
+    In "tracking" mode contiguous windows are decoded sequentially so MediaPipe can track landmarks
+    between frames; trackers are re-seeded at window boundaries and scene cuts.
+    max_frames defaults to the mode's budget in MAX_FRAMES.
+    pose_only skips the hand and face models (scenes get None for mudra and emotion), and max_width downscales frames before inference.
+    Pass a dict as thumbnails to collect a small copy of each analyzed frame, keyed by frame number.
+    With MediaPipe, decode, inference and classification overlap in a pipeline (see pipeline_stats).
+    """
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"Unknown analysis mode: {mode}")
+    tracking = mode == "tracking"
     
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
@@ -137,8 +360,9 @@ def analyze_video_frames(video_path: str, max_frames: int = 50):
     if total_frames == 0:
         raise RuntimeError("Video has no frames")
     
-    # Sample frames evenly
-    frame_indices = np.linspace(0, total_frames - 1, min(max_frames, total_frames), dtype=int)
+    if max_frames is None:
+        max_frames = MAX_FRAMES[mode]
+    frame_indices = select_frame_indices(total_frames, max_frames, mode)
     
     analysis_results = {
         "total_frames": total_frames,
@@ -147,6 +371,17 @@ def analyze_video_frames(video_path: str, max_frames: int = 50):
         "scenes": []
     }
     
+    # Only seek when the next wanted frame isn't the one the decoder is already positioned at
+    next_position = 0
+    
+    def read_frame(frame_num, buffer=None):
+        nonlocal next_position
+        if frame_num != next_position:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+        next_position = frame_num + 1
+        # Decode into the caller's buffer when it has one, instead of allocating a new frame
+        return cap.read() if buffer is None else cap.read(buffer)
+    
     # Try to use MediaPipe if available, otherwise use basic computer vision
     use_mediapipe = False
     try:
@@ -162,56 +397,173 @@ def analyze_video_frames(video_path: str, max_frames: int = 50):
             mp_hands = solutions.hands
             mp_face_mesh = solutions.face_mesh
             
-            with mp_pose.Pose(min_detection_confidence=0.5) as pose, \
-                 mp_hands.Hands(min_detection_confidence=0.5) as hands, \
-                 mp_face_mesh.FaceMesh(min_detection_confidence=0.5) as face_mesh:
-                
-                for idx, frame_num in enumerate(frame_indices):
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-                    ret, frame = cap.read()
-                    
-                    if not ret:
-                        continue
-                    
-                    # Convert BGR to RGB
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    
-                    # Process frame
-                    pose_results = pose.process(frame_rgb)
-                    hand_results = hands.process(frame_rgb)
-                    face_results = face_mesh.process(frame_rgb)
-                    
-                    # Analyze pose
-                    pose_detected = pose_results.pose_landmarks is not None
-                    
-                    # Analyze hands
-                    mudra = "No hands detected"
-                    if hand_results.multi_hand_landmarks:
-                        mudra = classify_mudra(hand_results.multi_hand_landmarks[0])
-                    
-                    # Analyze face
-                    emotion = "No face detected"
-                    if face_results.multi_face_landmarks:
-                        emotion = classify_emotion(face_results.multi_face_landmarks[0])
-                    
-                    # Determine action based on pose
-                    action = "Standing pose" if pose_detected else "Transitioning"
-                    
-                    timestamp = frame_num / fps if fps > 0 else 0
-                    
-                    scene_data = {
-                        "frame_number": int(frame_num),
-                        "timestamp_seconds": round(timestamp, 2),
-                        "pose_detected": pose_detected,
-                        "action": action,
-                        "mudra": mudra,
-                        "emotion": emotion,
-                        "interpretation": f"At {round(timestamp, 1)}s: Performer displays {emotion} through {action}, forming {mudra} mudra"
-                    }
+            detections = {"pose": 0} if pose_only else {"pose": 0, "hands": 0, "face": 0}
+            inference_seconds = 0.0
+            reseeds = 0
+            
+            monitor = PipelineMonitor(("decode", "inference", "classify"), ("frames", "results"))
+            frame_queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+            result_queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+            stop = threading.Event()
+            errors = []
+            
+            # RGB frames live in a fixed pool of buffers, handed back to the decoder once inference is done with them
+            rgb_buffers = [None] * (PIPELINE_QUEUE_DEPTH + 1)
+            free_buffers = queue.Queue()
+            for slot in range(len(rgb_buffers)):
+                free_buffers.put(slot)
+            
+            def decode():
+                """Decode stage: read, thumbnail, scene-cut check and colour conversion into a pooled buffer"""
+                read_buffer = None
+                resize_buffer = None
+                prev_frame_num = None
+                prev_hist = None
+                try:
+                    for frame_num in frame_indices:
+                        started = time.perf_counter()
+                        ret, frame = read_frame(frame_num, read_buffer)
+                        
+                        if not ret:
+                            continue
+                        read_buffer = frame
+                        
+                        capture_thumbnail(thumbnails, frame_num, frame)
+                        
+                        # Re-seed trackers when leaving a contiguous window or crossing a scene cut
+                        reseed = False
+                        if tracking:
+                            hist = frame_histogram(frame)
+                            window_break = prev_frame_num is not None and frame_num != prev_frame_num + 1
+                            reseed = window_break or is_scene_cut(prev_hist, hist)
+                            prev_frame_num = frame_num
+                            prev_hist = hist
+                        
+                        small = downscale_frame(frame, max_width, out=resize_buffer)
+                        if small is not frame:
+                            resize_buffer = frame = small
+                        monitor.add_busy("decode", time.perf_counter() - started)
+                        
+                        slot = pipeline_get(free_buffers, stop)
+                        if slot is _PIPELINE_DONE:
+                            return
+                        
+                        # Convert BGR to RGB
+                        started = time.perf_counter()
+                        rgb_buffers[slot] = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_buffers[slot])
+                        monitor.add_busy("decode", time.perf_counter() - started)
+                        
+                        monitor.sample("frames", frame_queue)
+                        if not pipeline_put(frame_queue, (frame_num, slot, reseed), stop):
+                            return
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+                finally:
+                    pipeline_put(frame_queue, _PIPELINE_DONE, stop)
+            
+            def classify():
+                """Classify stage: turns landmarks into scenes while the next frame is in inference"""
+                try:
+                    while True:
+                        item = pipeline_get(result_queue, stop)
+                        if item is _PIPELINE_DONE:
+                            return
+                        frame_num, pose_results, hand_results, face_results = item
+                        started = time.perf_counter()
+                        
+                        # Analyze pose
+                        pose_detected = pose_results.pose_landmarks is not None
+                        detections["pose"] += int(pose_detected)
+                        
+                        # Analyze hands
+                        mudra = None if pose_only else "No hands detected"
+                        if hand_results and hand_results.multi_hand_landmarks:
+                            detections["hands"] += 1
+                            mudra = classify_mudra(hand_results.multi_hand_landmarks[0])
+                        
+                        # Analyze face
+                        emotion = None if pose_only else "No face detected"
+                        if face_results and face_results.multi_face_landmarks:
+                            detections["face"] += 1
+                            emotion = classify_emotion(face_results.multi_face_landmarks[0])
+                        
+                        # Determine action based on pose
+                        action = "Standing pose" if pose_detected else "Transitioning"
+                        
+                        timestamp = frame_num / fps if fps > 0 else 0
+                        
+                        scene_data = {
+                            "frame_number": int(frame_num),
+                            "timestamp_seconds": round(timestamp, 2),
+                            "pose_detected": pose_detected,
+                            "action": action,
+                            "mudra": mudra,
+                            "emotion": emotion,
+                            "interpretation": describe_scene(timestamp, action, mudra, emotion)
+                        }
+                        
+                        analysis_results["scenes"].append(scene_data)
+                        monitor.add_busy("classify", time.perf_counter() - started)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+            
+            decoder = threading.Thread(target=decode, name="analysis-decode", daemon=True)
+            classifier = threading.Thread(target=classify, name="analysis-classify", daemon=True)
+            decoder.start()
+            classifier.start()
+            
+            # Inference stage runs on this thread, in frame order so tracking state stays consistent
+            try:
+                with mp_pose.Pose(static_image_mode=not tracking, min_detection_confidence=0.5) as pose, \
+                     mp_hands.Hands(static_image_mode=not tracking, min_detection_confidence=0.5) as hands, \
+                     mp_face_mesh.FaceMesh(static_image_mode=not tracking, min_detection_confidence=0.5) as face_mesh:
                     
-                    analysis_results["scenes"].append(scene_data)
+                    while True:
+                        item = pipeline_get(frame_queue, stop)
+                        if item is _PIPELINE_DONE:
+                            break
+                        frame_num, slot, reseed = item
+                        started = time.perf_counter()
+                        
+                        if reseed:
+                            pose.reset()
+                            hands.reset()
+                            face_mesh.reset()
+                            reseeds += 1
+                        
+                        # Process frame
+                        frame_rgb = rgb_buffers[slot]
+                        process_started = time.perf_counter()
+                        pose_results = pose.process(frame_rgb)
+                        hand_results = None if pose_only else hands.process(frame_rgb)
+                        face_results = None if pose_only else face_mesh.process(frame_rgb)
+                        inference_seconds += time.perf_counter() - process_started
+                        free_buffers.put(slot)
+                        monitor.add_busy("inference", time.perf_counter() - started)
+                        
+                        monitor.sample("results", result_queue)
+                        if not pipeline_put(result_queue, (frame_num, pose_results, hand_results, face_results), stop):
+                            break
+            except Exception:
+                stop.set()
+                raise
+            finally:
+                pipeline_put(result_queue, _PIPELINE_DONE, stop)
+                decoder.join()
+                classifier.join()
+            
+            if errors:
+                raise errors[0]
+            
+            analysis_results["inference_stats"] = build_inference_stats(
+                mode, "mediapipe", len(analysis_results["scenes"]), inference_seconds, detections, reseeds
+            )
+            analysis_results["pipeline_stats"] = monitor.snapshot()
         except Exception as e:
             logger.warning(f"MediaPipe processing failed: {str(e)}. Using fallback analysis.")
+            analysis_results["scenes"] = []
             use_mediapipe = False
     
     if not use_mediapipe:
@@ -221,71 +573,173 @@ def analyze_video_frames(video_path: str, max_frames: int = 50):
         actions_list = ["Standing pose", "Swaying movement", "Arm extension", "Turning motion", "Floor pattern"]
         
         for idx, frame_num in enumerate(frame_indices):
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-            ret, frame = cap.read()
+            ret, frame = read_frame(frame_num)
             
             if not ret:
                 continue
             
+            capture_thumbnail(thumbnails, frame_num, frame)
+            
             # Use frame number to generate pseudo-random but consistent data
             seed_val = int(frame_num * 7) % len(emotions_list)
             mudra_seed = int(frame_num * 11) % len(mudras_list)
             action_seed = int(frame_num * 13) % len(actions_list)
             
             timestamp = frame_num / fps if fps > 0 else 0
+            action = actions_list[action_seed]
+            mudra = None if pose_only else mudras_list[mudra_seed]
+            emotion = None if pose_only else emotions_list[seed_val]
             
             scene_data = {
                 "frame_number": int(frame_num),
                 "timestamp_seconds": round(timestamp, 2),
                 "pose_detected": True,
-                "action": actions_list[action_seed],
-                "mudra": mudras_list[mudra_seed],
-                "emotion": emotions_list[seed_val],
-                "interpretation": f"At {round(timestamp, 1)}s: Performer displays {emotions_list[seed_val]} through {actions_list[action_seed]}, forming {mudras_list[mudra_seed]} mudra"
+                "action": action,
+                "mudra": mudra,
+                "emotion": emotion,
+                "interpretation": describe_scene(timestamp, action, mudra, emotion)
             }
             
             analysis_results["scenes"].append(scene_data)
+        
+        analysis_results["inference_stats"] = build_inference_stats(
+            mode, "fallback", len(analysis_results["scenes"]), None, None, 0
+        )
     
     cap.release()
     return analysis_results
 
-async def generate_story_from_analysis(analysis_data: Dict[str, Any]) -> str:
-    """Generate natural language story using Google Generative AI"""
-    
-    # Configure Google Generative AI
+# Story generation - long performances are summarised chunk by chunk (map) and then composed (reduce)
+STORY_MODEL_NAME = 'gemini-pro'
+STORY_DIRECT_SCENE_LIMIT = 20
+STORY_CHUNK_SCENES = max(1, int(os.environ.get('STORY_CHUNK_SCENES', '20')))
+STORY_MAP_CONCURRENCY = max(1, int(os.environ.get('STORY_MAP_CONCURRENCY', '4')))
+STORY_CHUNK_CACHE_SIZE = 512
+
+# Chunk summaries keyed by model and chunk content, so regenerating or restyling skips the map step
+story_chunk_cache = OrderedDict()
+
+def get_story_model():
+    """Configure Google Generative AI and return the story model"""
     api_key = os.environ.get('GOOGLE_API_KEY', '')
     if api_key:
         genai.configure(api_key=api_key)
+    return genai.GenerativeModel(STORY_MODEL_NAME)
+
+def format_scenes(scenes: List[Dict[str, Any]], start_index: int = 0) -> str:
+    """Scene lines for a prompt, leaving out fields that weren't analyzed"""
+    lines = []
+    for i, scene in enumerate(scenes):
+        fields = [("Action", scene['action']), ("Mudra", scene.get('mudra')), ("Emotion", scene.get('emotion'))]
+        details = ", ".join(f"{name}: {value}" for name, value in fields if value)
+        lines.append(f"Scene {start_index + i + 1} (at {scene['timestamp_seconds']}s): {details}")
+    return "\n".join(lines)
+
+def simple_chunk_summary(scenes: List[Dict[str, Any]]) -> str:
+    """Fallback summary for a chunk whose LLM call failed"""
+    emotions = ", ".join(sorted({scene['emotion'] for scene in scenes if scene.get('emotion')}))
+    mudras = ", ".join(sorted({scene['mudra'] for scene in scenes if scene.get('mudra')}))
+    actions = ", ".join(sorted({scene['action'] for scene in scenes}))
+    summary = f"The segment features {actions}."
+    if emotions:
+        summary += f" They express {emotions}."
+    if mudras:
+        summary += f" They use the mudras {mudras}."
+    return summary
+
+async def summarize_scene_chunk(model, scenes: List[Dict[str, Any]], start_index: int,
+                                semaphore: asyncio.Semaphore) -> str:
+    """Map step: summarise one slice of the timeline, reusing a cached summary when available"""
+    scenes_text = format_scenes(scenes, start_index)
+    model_name = getattr(model, "model_name", type(model).__name__)
+    cache_key = hashlib.sha256(f"{model_name}\n{scenes_text}".encode()).hexdigest()
+    
+    if cache_key in story_chunk_cache:
+        story_chunk_cache.move_to_end(cache_key)
+        return story_chunk_cache[cache_key]
+    
+    prompt = f"""You are an expert in Bharatanatyam. Summarise what the dancer conveys in this segment of a performance in 2-3 sentences, noting the emotions, the significance of the mudras and how the segment develops.
+
+{scenes_text}
+
+Summary:"""
     
-    # Prepare structured prompt
-    scenes_text = "\n".join([
-        f"Scene {i+1} (at {scene['timestamp_seconds']}s): "
-        f"Action: {scene['action']}, Mudra: {scene['mudra']}, Emotion: {scene['emotion']}"
-        for i, scene in enumerate(analysis_data["scenes"][:20])  # Limit to first 20 scenes
+    try:
+        async with semaphore:
+            response = await model.generate_content_async(prompt)
+        summary = response.text.strip()
+    except Exception as e:
+        logger.warning(f"Chunk summary failed for scenes {start_index + 1}-{start_index + len(scenes)}: {str(e)}")
+        return simple_chunk_summary(scenes)
+    
+    story_chunk_cache[cache_key] = summary
+    if len(story_chunk_cache) > STORY_CHUNK_CACHE_SIZE:
+        story_chunk_cache.popitem(last=False)
+    return summary
+
+async def summarize_timeline(model, scenes: List[Dict[str, Any]]) -> str:
+    """Summarise the whole timeline in chunks with a bounded number of concurrent LLM calls"""
+    semaphore = asyncio.Semaphore(STORY_MAP_CONCURRENCY)
+    starts = range(0, len(scenes), STORY_CHUNK_SCENES)
+    summaries = await asyncio.gather(*[
+        summarize_scene_chunk(model, scenes[start:start + STORY_CHUNK_SCENES], start, semaphore)
+        for start in starts
+    ])
+    return "\n".join([
+        f"Segment {i + 1} ({scenes[start]['timestamp_seconds']}s - "
+        f"{scenes[min(start + STORY_CHUNK_SCENES, len(scenes)) - 1]['timestamp_seconds']}s): {summary}"
+        for i, (start, summary) in enumerate(zip(starts, summaries))
     ])
+
+async def generate_story_from_analysis(analysis_data: Dict[str, Any], style: Optional[str] = None, model=None) -> str:
+    """Generate natural language story using Google Generative AI
     
-    prompt = f"""You are an expert in Bharatanatyam, a classical Indian dance form. Based on the following dance performance analysis, create a beautiful, culturally sensitive natural-language story that explains what the dancer is conveying.
+    Performances with more than STORY_DIRECT_SCENE_LIMIT scenes are summarised hierarchically so the
+    whole timeline informs the story. Pass model to use anything with generate_content_async (e.g. a stub).
+    """
+    scenes = analysis_data["scenes"]
+    
+    try:
+        if model is None:
+            model = get_story_model()
+        
+        # Prepare structured prompt
+        if len(scenes) > STORY_DIRECT_SCENE_LIMIT:
+            timeline_heading = "Segment-by-Segment Summary:"
+            timeline_text = await summarize_timeline(model, scenes)
+        else:
+            timeline_heading = "Scene-by-Scene Analysis:"
+            timeline_text = format_scenes(scenes)
+        
+        style_text = f"\n6. Is told in this style: {style}" if style else ""
+        
+        # Reduced-quality analyses only cover body pose; keep the model from inventing gestures and expressions
+        quality_tier = analysis_data.get("quality_tier", "full")
+        quality_text = f"\nAnalysis Quality: {quality_tier}"
+        if any(not scene.get('mudra') or not scene.get('emotion') for scene in scenes):
+            quality_text += (" (hand gestures and/or facial expressions were not analyzed for some scenes; "
+                             "do not invent specific mudras or emotions for them)")
+        
+        prompt = f"""You are an expert in Bharatanatyam, a classical Indian dance form. Based on the following dance performance analysis, create a beautiful, culturally sensitive natural-language story that explains what the dancer is conveying.
 
 Dance Performance Analysis:
 Duration: {analysis_data['duration_seconds']:.1f} seconds
-Total Scenes Analyzed: {len(analysis_data['scenes'])}
+Total Scenes Analyzed: {len(scenes)}{quality_text}
 
-Scene-by-Scene Analysis:
-{scenes_text}
+{timeline_heading}
+{timeline_text}
 
 Please generate a cohesive, engaging narrative story (3-4 paragraphs) that:
 1. Explains what story the dancer is telling through these movements
 2. Interprets the emotional journey shown through facial expressions
 3. Describes the significance of the mudras (hand gestures) used
 4. Makes it understandable for someone unfamiliar with Bharatanatyam
-5. Maintains cultural sensitivity and respect for this classical art form
+5. Maintains cultural sensitivity and respect for this classical art form{style_text}
 
 Story:"""
-    
-    try:
+        
         # Use Google Generative AI
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(prompt)
+        response = await model.generate_content_async(prompt)
         return response.text
     except Exception as e:
         logger.error(f"Error generating story with AI: {str(e)}")
@@ -294,34 +748,208 @@ Story:"""
 
 def generate_simple_story(analysis_data: Dict[str, Any]) -> str:
     """Fallback: Generate a simple story without AI"""
-    emotions = [scene['emotion'] for scene in analysis_data['scenes']]
-    mudras = [scene['mudra'] for scene in analysis_data['scenes']]
+    emotions = [scene['emotion'] for scene in analysis_data['scenes'] if scene.get('emotion')]
+    mudras = [scene['mudra'] for scene in analysis_data['scenes'] if scene.get('mudra')]
     
-    emotion_summary = ", ".join(set(emotions)) if emotions else "grace"
-    mudra_summary = ", ".join(set(mudras)) if mudras else "traditional gestures"
+    # Expressions and mudras are missing from reduced-quality analyses, so only describe what was analyzed
+    if emotions:
+        emotion_text = f"The performer conveys emotions of {', '.join(set(emotions))} through expressive facial expressions and body language."
+    else:
+        emotion_text = "The performer's body language and movement carry the narrative."
     
-    story = f"""This Bharatanatyam dance piece spans {analysis_data['duration_seconds']:.1f} seconds and tells a profound story through movement. The performer conveys emotions of {emotion_summary} through expressive facial expressions and body language.
+    mudra_text = ""
+    if mudras:
+        mudra_text = f"""The dancer employs various mudras including {', '.join(set(mudras))}, each gesture carrying symbolic meaning rooted in classical Indian tradition. These hand positions combined with the flowing movements of the body create a visual narrative that captivates the audience.
 
-The dancer employs various mudras including {mudra_summary}, each gesture carrying symbolic meaning rooted in classical Indian tradition. These hand positions combined with the flowing movements of the body create a visual narrative that captivates the audience.
+"""
+    
+    story = f"""This Bharatanatyam dance piece spans {analysis_data['duration_seconds']:.1f} seconds and tells a profound story through movement. {emotion_text}
 
-Throughout the performance, the rhythm and precision of the movements demonstrate the technical mastery required in Bharatanatyam, while the emotional depth reveals the artistic interpretation of the classical tales. The dance serves as a bridge between ancient tradition and contemporary artistic expression."""
+{mudra_text}Throughout the performance, the rhythm and precision of the movements demonstrate the technical mastery required in Bharatanatyam, while the emotional depth reveals the artistic interpretation of the classical tales. The dance serves as a bridge between ancient tradition and contemporary artistic expression."""
     
     return story
 
+# Admission control - caps concurrent analyses and sheds load under bursts
+QUALITY_TIERS = {
+    "full": {"max_frames": dict(MAX_FRAMES), "pose_only": False, "max_width": None},
+    "reduced": {"max_frames": {mode: max(1, budget * 2 // 5) for mode, budget in MAX_FRAMES.items()},
+                "pose_only": True, "max_width": 640},
+}
+
+class AdmissionController:
+    """Tracks in-flight analyses and CPU load, deciding whether to run, degrade or reject an upload
+    
+    All calls happen on the event loop thread, so the counters need no locking.
+    """
+    
+    def __init__(self, max_in_flight: int, degrade_in_flight: int, max_cpu_load: float,
+                 degrade_cpu_load: float, retry_after_seconds: int):
+        self.max_in_flight = max_in_flight
+        self.degrade_in_flight = degrade_in_flight
+        self.max_cpu_load = max_cpu_load
+        self.degrade_cpu_load = degrade_cpu_load
+        self.retry_after_seconds = retry_after_seconds
+        self.in_flight = 0
+        self.counters = {"admitted_full": 0, "admitted_reduced": 0, "rejected": 0}
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_in_flight=int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '4')),
+            degrade_in_flight=int(os.environ.get('ADMISSION_DEGRADE_IN_FLIGHT', '2')),
+            max_cpu_load=float(os.environ.get('ADMISSION_MAX_CPU_LOAD', '1.5')),
+            degrade_cpu_load=float(os.environ.get('ADMISSION_DEGRADE_CPU_LOAD', '1.0')),
+            retry_after_seconds=int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', '30')),
+        )
+    
+    @staticmethod
+    def cpu_load() -> Optional[float]:
+        """1-minute load average per core, or None where the OS doesn't report it"""
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return None
+    
+    def admit(self) -> Optional[str]:
+        """Reserve a slot and return the quality tier to run at, or None if the upload should be rejected
+        
+        Load average is host-wide, not this container's CPU quota, so the CPU limits only apply once an
+        analysis is in flight; otherwise a busy neighbour could keep an idle server rejecting forever.
+        """
+        if self.in_flight >= self.max_in_flight:
+            self.counters["rejected"] += 1
+            return None
+        
+        load = self.cpu_load()
+        cpu_saturated = load is not None and load >= self.max_cpu_load
+        if cpu_saturated and self.in_flight > 0:
+            self.counters["rejected"] += 1
+            return None
+        
+        # A degrade threshold of 0 disables the reduced tier, except that an idle server on a
+        # saturated host still runs one analysis at the reduced tier rather than rejecting it
+        overloaded = self.degrade_in_flight and self.in_flight >= self.degrade_in_flight
+        cpu_busy = self.degrade_cpu_load and load is not None and load >= self.degrade_cpu_load
+        tier = "reduced" if overloaded or cpu_busy or cpu_saturated else "full"
+        
+        self.in_flight += 1
+        self.counters[f"admitted_{tier}"] += 1
+        return tier
+    
+    def release(self):
+        self.in_flight = max(0, self.in_flight - 1)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "cpu_load": self.cpu_load(),
+            "thresholds": {
+                "max_in_flight": self.max_in_flight,
+                "degrade_in_flight": self.degrade_in_flight,
+                "max_cpu_load": self.max_cpu_load,
+                "degrade_cpu_load": self.degrade_cpu_load,
+                "retry_after_seconds": self.retry_after_seconds,
+            },
+            "tiers": QUALITY_TIERS,
+            "counters": dict(self.counters),
+        }
+
+admission_controller = AdmissionController.from_env()
+
 @api_router.get("/")
 async def root():
     return {"message": "Bharatanatyam AI Story Generator API", "version": "1.0.0"}
 
+def admit_analysis() -> str:
+    """Reserve an analysis slot, raising 429 with Retry-After when the server is saturated"""
+    quality_tier = admission_controller.admit()
+    if quality_tier is None:
+        logger.warning(f"Rejecting upload under load: {admission_controller.snapshot()}")
+        raise HTTPException(
+            status_code=429,
+            detail="Server is busy analyzing other videos, please retry later",
+            headers={"Retry-After": str(admission_controller.retry_after_seconds)}
+        )
+    return quality_tier
+
+async def analyze_and_store(video_id: str, video_path: str, filename: str, mode: str, quality_tier: str) -> Dict[str, Any]:
+    """Analyze a saved video file, store the result and delete the file"""
+    try:
+        # Analyze video
+        logger.info(f"Starting analysis for video: {video_id}")
+        # Run off the event loop so in-flight analyses don't block other requests
+        tier_settings = dict(QUALITY_TIERS[quality_tier], max_frames=QUALITY_TIERS[quality_tier]["max_frames"][mode])
+        thumbnails = {}
+        analysis_data = await asyncio.to_thread(
+            analyze_video_frames, video_path, mode=mode, thumbnails=thumbnails, **tier_settings
+        )
+        analysis_data["quality_tier"] = quality_tier
+        logger.info(f"Inference stats for video {video_id}: {analysis_data['inference_stats']}")
+        sprite = await asyncio.to_thread(build_sprite_sheet, video_id, analysis_data, thumbnails)
+    finally:
+        # Clean up video file
+        if os.path.exists(video_path):
+            os.remove(video_path)
+    
+    # Store in database (if available) or cache
+    video_analysis = VideoAnalysis(
+        id=video_id,
+        video_filename=filename,
+        analysis_data=analysis_data,
+        status="analyzed"
+    )
+    
+    if db_available:
+        try:
+            doc = video_analysis.model_dump()
+            doc['timestamp'] = doc['timestamp'].isoformat()
+            await db.video_analyses.insert_one(doc)
+            if sprite:
+                await db.video_sprites.insert_one({"id": video_id, "data": sprite, "format": THUMBNAIL_FORMAT})
+            logger.info(f"Analysis stored in database for video: {video_id}")
+        except Exception as e:
+            logger.warning(f"Failed to store analysis in database: {str(e)}")
+    else:
+        if sprite:
+            sprite_cache[video_id] = {"data": sprite, "format": THUMBNAIL_FORMAT}
+        # Store in memory cache
+        analysis_cache[video_id] = {
+            "id": video_id,
+            "video_filename": filename,
+            "analysis_data": analysis_data,
+            "status": "analyzed",
+            "generated_story": None,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+        logger.info(f"Analysis stored in memory cache for video: {video_id}")
+        logger.info(f"Cache now contains: {list(analysis_cache.keys())}")
+    
+    logger.info(f"Analysis complete for video: {video_id}")
+    
+    return {
+        "video_id": video_id,
+        "filename": filename,
+        "analysis": analysis_data,
+        "status": "analyzed"
+    }
+
 @api_router.post("/upload-video")
-async def upload_video(file: UploadFile = File(...)):
-    """Upload and process a Bharatanatyam video"""
+async def upload_video(file: UploadFile = File(...), mode: str = "sampled"):
+    """Upload and process a Bharatanatyam video
+    
+    Pass mode=tracking to analyze contiguous windows with MediaPipe tracking instead of sparse samples.
+    """
     # Validate file type
     if not file.content_type.startswith('video/'):
         raise HTTPException(status_code=400, detail="File must be a video")
     
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"Mode must be one of: {', '.join(ANALYSIS_MODES)}")
+    
+    quality_tier = admit_analysis()
+    
     try:
         # Save video temporarily - use cross-platform temp directory
-        import tempfile
         video_id = str(uuid.uuid4())
         temp_dir = tempfile.gettempdir()
         video_path = os.path.join(temp_dir, f"{video_id}_{file.filename}")
@@ -333,54 +961,212 @@ async def upload_video(file: UploadFile = File(...)):
         
         logger.info(f"Video file size: {os.path.getsize(video_path)} bytes")
         
-        # Analyze video
-        logger.info(f"Starting analysis for video: {video_id}")
-        analysis_data = analyze_video_frames(video_path)
+        return await analyze_and_store(video_id, video_path, file.filename, mode, quality_tier)
+    
+    except Exception as e:
+        logger.error(f"Error processing video: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing video: {str(e)}")
+    finally:
+        admission_controller.release()
+
+# Resumable uploads - create a session, PATCH chunks at the current offset, then finalize
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(2 * 1024 ** 3)))
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get('UPLOAD_SESSION_TTL_SECONDS', str(24 * 3600)))
+UPLOAD_GC_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_GC_INTERVAL_SECONDS', '600'))
+# Partial uploads get their own directory so files orphaned by a restart can be found and swept
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', os.path.join(tempfile.gettempdir(), 'natya-uploads'))
+
+upload_sessions = {}
+
+def get_upload_session(upload_id: str) -> Dict[str, Any]:
+    session = upload_sessions.get(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+def ensure_upload_session_current(upload_id: str, session: Dict[str, Any]):
+    """After waiting for a session's lock, make sure a finalize or the GC didn't remove it meanwhile"""
+    if upload_sessions.get(upload_id) is not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+def upload_session_status(session: Dict[str, Any], status_code: int = 200) -> JSONResponse:
+    """Session progress, with the offset also in an Upload-Offset header for resuming clients"""
+    idle = time.monotonic() - session["updated_at"]
+    return JSONResponse(
+        content={
+            "upload_id": session["id"],
+            "filename": session["filename"],
+            "offset": session["offset"],
+            "total_size": session["total_size"],
+            "expires_in_seconds": max(0, int(UPLOAD_SESSION_TTL_SECONDS - idle))
+        },
+        status_code=status_code,
+        headers={"Upload-Offset": str(session["offset"])}
+    )
+
+def discard_upload_session(upload_id: str):
+    session = upload_sessions.pop(upload_id, None)
+    if session and os.path.exists(session["path"]):
+        os.remove(session["path"])
+
+def collect_abandoned_uploads() -> int:
+    """Drop sessions idle for longer than the TTL along with their partial files
+    
+    Files in UPLOAD_DIR without a live session (e.g. left behind by a restart) are removed once their
+    mtime is older than the TTL, so other workers sharing the directory keep their in-progress uploads.
+    """
+    now = time.monotonic()
+    expired = [
+        upload_id for upload_id, session in upload_sessions.items()
+        if now - session["updated_at"] > UPLOAD_SESSION_TTL_SECONDS and not session["lock"].locked()
+    ]
+    for upload_id in expired:
+        discard_upload_session(upload_id)
+    
+    orphaned = 0
+    live_paths = {session["path"] for session in upload_sessions.values()}
+    if os.path.isdir(UPLOAD_DIR):
+        cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+        for entry in os.scandir(UPLOAD_DIR):
+            if entry.is_file() and entry.path not in live_paths and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                orphaned += 1
+    
+    if expired or orphaned:
+        logger.info(f"Garbage-collected {len(expired)} abandoned upload sessions and {orphaned} orphaned files")
+    return len(expired) + orphaned
+
+async def upload_gc_loop():
+    while True:
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_SECONDS)
+        try:
+            collect_abandoned_uploads()
+        except Exception as e:
+            logger.warning(f"Upload session cleanup failed: {str(e)}")
+
+@api_router.post("/uploads", status_code=201)
+async def create_upload_session(request: UploadSessionRequest):
+    """Start a resumable upload"""
+    if not request.content_type.startswith('video/'):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    if request.mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"Mode must be one of: {', '.join(ANALYSIS_MODES)}")
+    if request.total_size <= 0 or request.total_size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload size must be between 1 and {UPLOAD_MAX_BYTES} bytes")
+    
+    upload_id = str(uuid.uuid4())
+    filename = os.path.basename(request.filename)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{upload_id}_{filename}")
+    open(path, "wb").close()
+    
+    upload_sessions[upload_id] = {
+        "id": upload_id,
+        "filename": filename,
+        "mode": request.mode,
+        "path": path,
+        "total_size": request.total_size,
+        "offset": 0,
+        "sha256": hashlib.sha256(),
+        "lock": asyncio.Lock(),
+        "updated_at": time.monotonic()
+    }
+    logger.info(f"Created upload session {upload_id} for {filename} ({request.total_size} bytes)")
+    return upload_session_status(upload_sessions[upload_id], status_code=201)
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload_session_status(upload_id: str):
+    """Current offset of a resumable upload, so a dropped client knows where to continue"""
+    return upload_session_status(get_upload_session(upload_id))
+
+@api_router.patch("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, upload_offset: int = Header(...),
+                       x_chunk_sha256: Optional[str] = Header(None)):
+    """Append the request body at Upload-Offset, optionally verified against X-Chunk-SHA256"""
+    session = get_upload_session(upload_id)
+    
+    async with session["lock"]:
+        ensure_upload_session_current(upload_id, session)
+        if upload_offset != session["offset"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Offset mismatch, upload is at byte {session['offset']}",
+                headers={"Upload-Offset": str(session["offset"])}
+            )
         
-        # Store in database (if available) or cache
-        video_analysis = VideoAnalysis(
-            id=video_id,
-            video_filename=file.filename,
-            analysis_data=analysis_data,
-            status="analyzed"
-        )
+        # Stream straight into the temp file. A rejected chunk is rolled back; a dropped connection keeps
+        # every byte that was fully written, so the client resumes from there instead of resending the chunk
+        chunk_hash = hashlib.sha256()
+        file_hash = session["sha256"].copy()
+        end = upload_offset
         
-        if db_available:
-            try:
-                doc = video_analysis.model_dump()
-                doc['timestamp'] = doc['timestamp'].isoformat()
-                await db.video_analyses.insert_one(doc)
-                logger.info(f"Analysis stored in database for video: {video_id}")
-            except Exception as e:
-                logger.warning(f"Failed to store analysis in database: {str(e)}")
-        else:
-            # Store in memory cache
-            analysis_cache[video_id] = {
-                "id": video_id,
-                "video_filename": file.filename,
-                "analysis_data": analysis_data,
-                "status": "analyzed",
-                "generated_story": None,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            logger.info(f"Analysis stored in memory cache for video: {video_id}")
-            logger.info(f"Cache now contains: {list(analysis_cache.keys())}")
+        def commit():
+            session["offset"] = end
+            session["sha256"] = file_hash
+            session["updated_at"] = time.monotonic()
         
-        # Clean up video file
-        os.remove(video_path)
+        with open(session["path"], "r+b") as f:
+            f.seek(upload_offset)
+            try:
+                async for piece in request.stream():
+                    if end + len(piece) > session["total_size"]:
+                        raise HTTPException(status_code=413, detail="Chunk extends past the declared upload size")
+                    f.write(piece)
+                    chunk_hash.update(piece)
+                    file_hash.update(piece)
+                    end += len(piece)
+                
+                if x_chunk_sha256 and chunk_hash.hexdigest() != x_chunk_sha256.lower():
+                    raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+            except HTTPException:
+                f.truncate(upload_offset)
+                raise
+            except ClientDisconnect:
+                f.truncate(end)
+                commit()
+                logger.info(f"Upload {upload_id} disconnected, kept {end - upload_offset} bytes of the chunk")
+                return upload_session_status(session)
+            except BaseException:
+                f.truncate(end)
+                commit()
+                raise
         
-        logger.info(f"Analysis complete for video: {video_id}")
+        commit()
+        return upload_session_status(session)
+
+@api_router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, request: FinalizeUploadRequest):
+    """Verify a completed upload and hand it off to video analysis"""
+    session = get_upload_session(upload_id)
+    
+    async with session["lock"]:
+        ensure_upload_session_current(upload_id, session)
+        if session["offset"] != session["total_size"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {session['offset']} of {session['total_size']} bytes received",
+                headers={"Upload-Offset": str(session["offset"])}
+            )
+        if request.sha256 and session["sha256"].hexdigest() != request.sha256.lower():
+            discard_upload_session(upload_id)
+            raise HTTPException(status_code=400, detail="File checksum mismatch, upload discarded")
         
-        return {
-            "video_id": video_id,
-            "filename": file.filename,
-            "analysis": analysis_data,
-            "status": "analyzed"
-        }
+        # Keep the session (and its file) if the server is too busy, so the client can retry finalize
+        quality_tier = admit_analysis()
+        upload_sessions.pop(upload_id, None)
     
+    try:
+        return await analyze_and_store(upload_id, session["path"], session["filename"], session["mode"], quality_tier)
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing video: {str(e)}")
+    finally:
+        admission_controller.release()
+
+@api_router.get("/admission")
+async def get_admission_status():
+    """Current admission control load, thresholds and counters"""
+    return admission_controller.snapshot()
 
 @api_router.post("/generate-story", response_model=StoryResponse)
 async def generate_story(request: StoryGenerationRequest):
@@ -410,10 +1196,10 @@ async def generate_story(request: StoryGenerationRequest):
         if not analysis_doc:
             raise HTTPException(status_code=404, detail="Analysis not found")
         
-        # Generate story if not already generated
-        if not analysis_doc.get('generated_story'):
+        # Generate story if not already generated, or when a new style or regeneration is requested
+        if not analysis_doc.get('generated_story') or request.style or request.regenerate:
             logger.info(f"Generating story for analysis: {request.analysis_id}")
-            story = await generate_story_from_analysis(analysis_doc['analysis_data'])
+            story = await generate_story_from_analysis(analysis_doc['analysis_data'], style=request.style)
             
             # Update database or cache
             if db_available:
@@ -460,6 +1246,35 @@ async def get_analysis(video_id: str):
     
     return analysis_doc
 
+@api_router.get("/analysis/{video_id}/sprite")
+async def get_analysis_sprite(video_id: str, if_none_match: Optional[str] = Header(None)):
+    """Timeline thumbnail sprite sheet; tile offsets are in each scene's "thumbnail" field"""
+    sprite_doc = None
+    
+    if db_available:
+        try:
+            sprite_doc = await db.video_sprites.find_one({"id": video_id}, {"_id": 0})
+        except Exception as e:
+            logger.warning(f"Failed to fetch from database: {str(e)}")
+    
+    # Fallback to cache
+    if not sprite_doc:
+        sprite_doc = sprite_cache.get(video_id)
+    
+    if not sprite_doc:
+        raise HTTPException(status_code=404, detail="Sprite not found")
+    
+    # A video's sprite never changes, so clients can cache it indefinitely
+    sprite = sprite_doc["data"]
+    etag = f'"{hashlib.sha256(sprite).hexdigest()[:16]}"'
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": etag}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    
+    # Use the format the sprite was encoded in, which may predate a THUMBNAIL_FORMAT change
+    media_type = THUMBNAIL_MEDIA_TYPES.get(sprite_doc.get("format"), "image/jpeg")
+    return Response(content=sprite, media_type=media_type, headers=headers)
+
 @api_router.get("/analyses")
 async def list_analyses():
     """List all video analyses"""
@@ -489,6 +1304,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "Upload-Offset"],
 )
 
 # Configure logging
@@ -498,6 +1314,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_upload_gc():
+    # Sweep files orphaned by a previous run before accepting uploads
+    try:
+        collect_abandoned_uploads()
+    except Exception as e:
+        logger.warning(f"Upload session cleanup failed: {str(e)}")
+    app.state.upload_gc_task = asyncio.create_task(upload_gc_loop())
+
+@app.on_event("shutdown")
+async def stop_upload_gc():
+    task = getattr(app.state, "upload_gc_task", None)
+    if task:
+        task.cancel()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     if db_available and 'client' in globals():
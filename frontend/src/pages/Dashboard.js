@@ -10,6 +10,39 @@ import { toast } from "sonner";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+const MAX_FINALIZE_RETRIES = 5;
+
+const uploadKey = (file) => `natya-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+// The pending session id is kept in localStorage so a page reload can still resume the upload
+const getPendingUpload = (file) => {
+  try {
+    return window.localStorage.getItem(uploadKey(file));
+  } catch {
+    return null;
+  }
+};
+
+const setPendingUpload = (file, uploadId) => {
+  try {
+    if (uploadId) {
+      window.localStorage.setItem(uploadKey(file), uploadId);
+    } else {
+      window.localStorage.removeItem(uploadKey(file));
+    }
+  } catch {
+    // Storage unavailable (e.g. private mode); uploads still work, just without resume across reloads
+  }
+};
+
+const sha256Hex = async (blob) => {
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+};
+
 const Dashboard = () => {
   const navigate = useNavigate();
   const fileInputRef = useRef(null);
@@ -34,31 +67,90 @@ const Dashboard = () => {
     }
   };
 
+  const startOrResumeUpload = async (file) => {
+    const pendingUploadId = getPendingUpload(file);
+    if (pendingUploadId) {
+      try {
+        const status = await axios.get(`${API}/uploads/${pendingUploadId}`);
+        return { uploadId: pendingUploadId, offset: status.data.offset };
+      } catch (error) {
+        // The session expired or was consumed, so start a new one
+        if (error.response?.status !== 404) throw error;
+      }
+    }
+
+    const session = await axios.post(`${API}/uploads`, {
+      filename: file.name,
+      content_type: file.type,
+      total_size: file.size,
+    });
+    setPendingUpload(file, session.data.upload_id);
+    return { uploadId: session.data.upload_id, offset: session.data.offset };
+  };
+
+  // The server keeps the uploaded file when it's too busy to analyze it, so wait and finalize again
+  const finalizeUpload = async (uploadId) => {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        return await axios.post(`${API}/uploads/${uploadId}/finalize`, {});
+      } catch (error) {
+        if (error.response?.status !== 429 || attempt >= MAX_FINALIZE_RETRIES) throw error;
+        const retryAfter = Number(error.response.headers['retry-after']) || 5;
+        toast.info(`Server is busy, retrying analysis in ${retryAfter}s...`);
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+      }
+    }
+  };
+
+  // Resumable upload: a dropped chunk is retried from the server's offset instead of starting over
+  const uploadInChunks = async (file) => {
+    const { uploadId, offset: resumeOffset } = await startOrResumeUpload(file);
+    let offset = resumeOffset;
+    let retries = 0;
+
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + CHUNK_SIZE);
+      try {
+        const checksum = await sha256Hex(chunk);
+        const response = await axios.patch(`${API}/uploads/${uploadId}`, chunk, {
+          headers: {
+            'Content-Type': 'application/offset+octet-stream',
+            'Upload-Offset': offset,
+            ...(checksum && { 'X-Chunk-SHA256': checksum }),
+          },
+        });
+        offset = response.data.offset;
+        retries = 0;
+        setUploadProgress(Math.round((offset * 100) / file.size));
+      } catch (error) {
+        if (++retries > MAX_CHUNK_RETRIES) throw error;
+        await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+        offset = await axios
+          .get(`${API}/uploads/${uploadId}`)
+          .then((status) => status.data.offset)
+          .catch(() => offset);
+      }
+    }
+
+    const response = await finalizeUpload(uploadId);
+    setPendingUpload(file, null);
+    return response;
+  };
+
   const handleUploadAndAnalyze = async () => {
     if (!selectedFile) {
       toast.error("Please select a video file first");
       return;
     }
 
-    const formData = new FormData();
-    formData.append('file', selectedFile);
-
     setUploading(true);
     setAnalyzing(true);
     setUploadProgress(0);
 
     try {
       toast.info("Uploading and analyzing video...");
-      
-      const response = await axios.post(`${API}/upload-video`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-        onUploadProgress: (progressEvent) => {
-          const progress = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-          setUploadProgress(progress);
-        },
-      });
+
+      const response = await uploadInChunks(selectedFile);
 
       setAnalysis(response.data);
       toast.success("Video analyzed successfully!");
@@ -318,14 +410,29 @@ const Dashboard = () => {
                     className="flex-shrink-0 w-48 bg-muted/30 rounded-lg p-3 border border-border/30 hover:border-accent/50 transition-colors"
                   >
                     <div className="space-y-2">
+                      {analysis.analysis.sprite && scene.thumbnail && (
+                        <div
+                          className="rounded-md"
+                          style={{
+                            width: analysis.analysis.sprite.tile_width,
+                            height: analysis.analysis.sprite.tile_height,
+                            backgroundImage: `url(${BACKEND_URL}${analysis.analysis.sprite.url})`,
+                            backgroundPosition: `-${scene.thumbnail.x}px -${scene.thumbnail.y}px`,
+                          }}
+                        />
+                      )}
                       <div className="flex items-center justify-between">
                         <span className="font-mono text-xs text-accent">{scene.timestamp_seconds}s</span>
                         <span className="font-mono text-xs text-muted-foreground">#{idx + 1}</span>
                       </div>
                       <div className="space-y-1 text-xs">
                         <p className="text-foreground/80"><span className="font-semibold">Action:</span> {scene.action}</p>
-                        <p className="text-foreground/80"><span className="font-semibold">Mudra:</span> {scene.mudra}</p>
-                        <p className="text-foreground/80"><span className="font-semibold">Emotion:</span> {scene.emotion}</p>
+                        {scene.mudra && (
+                          <p className="text-foreground/80"><span className="font-semibold">Mudra:</span> {scene.mudra}</p>
+                        )}
+                        {scene.emotion && (
+                          <p className="text-foreground/80"><span className="font-semibold">Emotion:</span> {scene.emotion}</p>
+                        )}
                       </div>
                     </div>
                   </div>
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'backend'))
+
+import server
+
+
+@pytest.fixture
+def client():
+    """API client without startup events, so no background tasks run during tests"""
+    from fastapi.testclient import TestClient
+    return TestClient(server.app)
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    """Fresh admission controller on an idle host, installed as the server's controller"""
+    controller = server.AdmissionController(
+        max_in_flight=2, degrade_in_flight=1, max_cpu_load=1.5, degrade_cpu_load=1.0, retry_after_seconds=7
+    )
+    monkeypatch.setattr(controller, "cpu_load", lambda: 0.1)
+    monkeypatch.setattr(server, "admission_controller", controller)
+    return controller
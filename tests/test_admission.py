@@ -0,0 +1,67 @@
+import server
+
+
+def test_rejects_at_max_in_flight(controller):
+    assert controller.admit() == "full"
+    assert controller.admit() == "reduced"
+    assert controller.admit() is None
+    assert controller.counters == {"admitted_full": 1, "admitted_reduced": 1, "rejected": 1}
+
+
+def test_cpu_saturation_rejects_only_while_busy(controller, monkeypatch):
+    monkeypatch.setattr(controller, "cpu_load", lambda: 3.0)
+    assert controller.admit() == "reduced"
+    assert controller.admit() is None
+    
+    controller.release()
+    assert controller.admit() == "reduced"
+
+
+def test_cpu_load_between_thresholds_degrades(controller, monkeypatch):
+    monkeypatch.setattr(controller, "cpu_load", lambda: 1.2)
+    assert controller.admit() == "reduced"
+
+
+def test_unknown_cpu_load_is_ignored(controller, monkeypatch):
+    monkeypatch.setattr(controller, "cpu_load", lambda: None)
+    assert controller.admit() == "full"
+
+
+def test_zero_degrade_thresholds_disable_reduced_tier(controller, monkeypatch):
+    controller.degrade_in_flight = 0
+    controller.degrade_cpu_load = 0
+    monkeypatch.setattr(controller, "cpu_load", lambda: 1.2)
+    assert controller.admit() == "full"
+    assert controller.admit() == "full"
+    assert controller.admit() is None
+
+
+def test_release_never_goes_negative(controller):
+    controller.release()
+    assert controller.in_flight == 0
+
+
+def test_upload_rejected_with_retry_after(client, controller):
+    controller.max_in_flight = 0
+    response = client.post("/api/upload-video", files={"file": ("a.mp4", b"data", "video/mp4")})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+
+
+def test_slot_released_after_failed_analysis(client, controller, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("decoder exploded")
+    monkeypatch.setattr(server, "analyze_video_frames", fail)
+    
+    response = client.post("/api/upload-video", files={"file": ("a.mp4", b"data", "video/mp4")})
+    assert response.status_code == 500
+    assert controller.in_flight == 0
+    assert controller.counters["admitted_full"] == 1
+
+
+def test_admission_status_endpoint(client, controller):
+    controller.admit()
+    body = client.get("/api/admission").json()
+    assert body["in_flight"] == 1
+    assert body["thresholds"]["max_in_flight"] == 2
+    assert body["tiers"]["reduced"]["pose_only"] is True
@@ -0,0 +1,127 @@
+import threading
+from types import SimpleNamespace
+
+import cv2
+import mediapipe
+import numpy as np
+import pytest
+
+import server
+
+
+class StubSolution:
+    """Stand-in for a legacy MediaPipe solution that records the frame buffers it is given"""
+    
+    buffers = set()
+    fail_after = None
+    calls = 0
+    
+    def __init__(self, static_image_mode=True, min_detection_confidence=0.5):
+        self.static_image_mode = static_image_mode
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def reset(self):
+        pass
+    
+    def process(self, image):
+        cls = StubSolution
+        cls.calls += 1
+        if cls.fail_after is not None and cls.calls > cls.fail_after:
+            raise RuntimeError("inference failed")
+        assert image.shape[2] == 3 and image.flags["C_CONTIGUOUS"]
+        cls.buffers.add(image.__array_interface__["data"][0])
+        landmarks = SimpleNamespace(landmark=[SimpleNamespace(x=0.5, y=0.5) for _ in range(478)])
+        return SimpleNamespace(pose_landmarks=landmarks, multi_hand_landmarks=[landmarks],
+                               multi_face_landmarks=[landmarks])
+
+
+@pytest.fixture(autouse=True)
+def stub_solutions(monkeypatch):
+    StubSolution.buffers = set()
+    StubSolution.fail_after = None
+    StubSolution.calls = 0
+    solutions = SimpleNamespace(
+        pose=SimpleNamespace(Pose=StubSolution),
+        hands=SimpleNamespace(Hands=StubSolution),
+        face_mesh=SimpleNamespace(FaceMesh=StubSolution),
+    )
+    monkeypatch.setattr(mediapipe, "solutions", solutions, raising=False)
+    return solutions
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "dance.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (320, 240))
+    for i in range(90):
+        frame = np.full((240, 320, 3), 40 if i < 45 else 200, np.uint8)
+        cv2.putText(frame, str(i), (20, 120), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 255), 3)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def analyze(*args, **kwargs):
+    """Run the analysis on a worker thread so a pipeline deadlock fails the test instead of hanging it"""
+    threads_before = threading.active_count()
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(server.analyze_video_frames(*args, **kwargs)))
+    worker.start()
+    worker.join(timeout=30)
+    assert not worker.is_alive(), "analysis pipeline hung"
+    assert threading.active_count() == threads_before
+    return result
+
+
+@pytest.mark.parametrize("mode", server.ANALYSIS_MODES)
+def test_pipeline_processes_frames_in_order(video, mode):
+    result = analyze(video, max_frames=30, mode=mode)
+    
+    assert result["inference_stats"]["engine"] == "mediapipe"
+    assert result["inference_stats"]["frames_processed"] == 30
+    frame_numbers = [scene["frame_number"] for scene in result["scenes"]]
+    assert frame_numbers == sorted(frame_numbers)
+    assert result["scenes"][0]["mudra"] and result["scenes"][0]["emotion"]
+    
+    stats = result["pipeline_stats"]
+    assert set(stats["stages"]) == {"decode", "inference", "classify"}
+    assert all(queue["max_occupancy"] <= server.PIPELINE_QUEUE_DEPTH for queue in stats["queues"].values())
+    # RGB frames come from the fixed buffer pool rather than a fresh array per frame
+    assert 1 <= len(StubSolution.buffers) <= server.PIPELINE_QUEUE_DEPTH + 1
+
+
+def test_pipeline_collects_thumbnails_and_downscales(video):
+    thumbnails = {}
+    result = analyze(video, max_frames=10, max_width=160, thumbnails=thumbnails)
+    assert sorted(thumbnails) == [scene["frame_number"] for scene in result["scenes"]]
+    assert result["inference_stats"]["engine"] == "mediapipe"
+
+
+def test_inference_failure_falls_back(video):
+    StubSolution.fail_after = 10
+    result = analyze(video, max_frames=30)
+    assert result["inference_stats"]["engine"] == "fallback"
+    assert len(result["scenes"]) == 30
+    assert "pipeline_stats" not in result
+
+
+def test_classify_failure_falls_back(video, monkeypatch):
+    def fail(hand_landmarks):
+        raise ValueError("bad landmarks")
+    monkeypatch.setattr(server, "classify_mudra", fail)
+    result = analyze(video, max_frames=30)
+    assert result["inference_stats"]["engine"] == "fallback"
+
+
+def test_decode_failure_falls_back(video, monkeypatch):
+    def fail(frame):
+        raise cv2.error("corrupt frame")
+    monkeypatch.setattr(server, "frame_histogram", fail)
+    result = analyze(video, max_frames=30, mode="tracking")
+    assert result["inference_stats"]["engine"] == "fallback"
+    assert result["inference_stats"]["avg_ms_per_frame"] is None
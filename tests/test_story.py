@@ -0,0 +1,125 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+import server
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """Local stand-in for the Gemini model that records prompts and concurrent calls"""
+    
+    model_name = "stub"
+    
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.prompts = []
+        self.active = 0
+        self.max_active = 0
+    
+    async def generate_content_async(self, prompt):
+        self.prompts.append(prompt)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return Response(f"response {len(self.prompts)}")
+    
+    @property
+    def map_prompts(self):
+        return [prompt for prompt in self.prompts if prompt.endswith("Summary:")]
+
+
+def analysis(scene_count):
+    return {
+        "duration_seconds": scene_count / 2,
+        "scenes": [
+            {"timestamp_seconds": i / 2, "action": "Standing pose",
+             "mudra": "Pataka (Flag)", "emotion": f"Emotion {i}"}
+            for i in range(scene_count)
+        ]
+    }
+
+
+@pytest.fixture(autouse=True)
+def chunk_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(server, "story_chunk_cache", cache)
+    monkeypatch.setattr(server, "STORY_CHUNK_SCENES", 20)
+    return cache
+
+
+def test_short_performance_uses_single_call():
+    model = StubModel()
+    story = asyncio.run(server.generate_story_from_analysis(analysis(20), model=model))
+    assert story == "response 1"
+    assert len(model.prompts) == 1
+    assert "Scene 20 (at 9.5s)" in model.prompts[0]
+
+
+def test_long_performance_summarises_every_chunk():
+    model = StubModel()
+    asyncio.run(server.generate_story_from_analysis(analysis(45), model=model))
+    assert len(model.map_prompts) == 3
+    assert len(model.prompts) == 4
+    
+    final_prompt = model.prompts[-1]
+    assert "Segment 3 (20.0s - 22.0s)" in final_prompt
+    assert any("Scene 45 (at 22.0s)" in prompt for prompt in model.map_prompts)
+
+
+def test_map_concurrency_is_bounded(monkeypatch):
+    monkeypatch.setattr(server, "STORY_MAP_CONCURRENCY", 2)
+    model = StubModel()
+    asyncio.run(server.generate_story_from_analysis(analysis(200), model=model))
+    assert len(model.map_prompts) == 10
+    assert model.max_active == 2
+
+
+def test_restyle_reuses_cached_chunk_summaries(chunk_cache):
+    model = StubModel()
+    data = analysis(45)
+    asyncio.run(server.generate_story_from_analysis(data, model=model))
+    assert len(chunk_cache) == 3
+    
+    model.prompts.clear()
+    asyncio.run(server.generate_story_from_analysis(data, style="a bedtime story", model=model))
+    assert len(model.prompts) == 1
+    assert "a bedtime story" in model.prompts[0]
+
+
+def test_failed_chunk_falls_back_without_caching(chunk_cache):
+    class FlakyModel(StubModel):
+        async def generate_content_async(self, prompt):
+            if prompt.endswith("Summary:") and "Scene 1 " in prompt:
+                raise RuntimeError("quota exceeded")
+            return await super().generate_content_async(prompt)
+    
+    model = FlakyModel()
+    asyncio.run(server.generate_story_from_analysis(analysis(45), model=model))
+    assert len(chunk_cache) == 2
+    assert "Segment 1 (0.0s - 9.5s): The segment features Standing pose." in model.prompts[-1]
+
+
+def test_regenerate_endpoint_skips_map_step(client, monkeypatch):
+    model = StubModel()
+    monkeypatch.setattr(server, "get_story_model", lambda: model)
+    monkeypatch.setitem(server.analysis_cache, "long-recital", {
+        "id": "long-recital", "analysis_data": analysis(45), "generated_story": None
+    })
+    
+    response = client.post("/api/generate-story", json={"analysis_id": "long-recital"})
+    assert response.json()["story"] == "response 4"
+    
+    # A stored story is returned as-is unless regeneration is asked for
+    client.post("/api/generate-story", json={"analysis_id": "long-recital"})
+    assert len(model.prompts) == 4
+    
+    response = client.post("/api/generate-story", json={"analysis_id": "long-recital", "regenerate": True})
+    assert len(model.prompts) == 5
+    assert response.json()["story"] == "response 5"
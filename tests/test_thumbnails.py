@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+import pytest
+
+import server
+
+
+def scene(frame_number):
+    return {"frame_number": frame_number, "timestamp_seconds": frame_number / 30}
+
+
+def capture(frame_numbers, shape=(480, 640, 3)):
+    thumbnails = {}
+    for frame_number in frame_numbers:
+        server.capture_thumbnail(thumbnails, frame_number, np.full(shape, frame_number, np.uint8))
+    return thumbnails
+
+
+def test_capture_thumbnail_keeps_aspect_ratio():
+    thumbnails = capture([3])
+    assert thumbnails[3].shape == (120, 160, 3)
+
+
+def test_capture_thumbnail_is_noop_without_collector():
+    server.capture_thumbnail(None, 0, np.zeros((480, 640, 3), np.uint8))
+
+
+def test_sprite_sheet_layout_and_offsets():
+    frames = list(range(0, 120, 10))
+    analysis = {"scenes": [scene(n) for n in frames]}
+    sprite = server.build_sprite_sheet("vid", analysis, capture(frames))
+    
+    assert analysis["sprite"] == {
+        "url": "/api/analysis/vid/sprite", "format": "jpeg",
+        "tile_width": 160, "tile_height": 120, "columns": 10, "rows": 2
+    }
+    assert analysis["scenes"][0]["thumbnail"] == {"x": 0, "y": 0}
+    assert analysis["scenes"][9]["thumbnail"] == {"x": 1440, "y": 0}
+    assert analysis["scenes"][11]["thumbnail"] == {"x": 160, "y": 120}
+    
+    sheet = cv2.imdecode(np.frombuffer(sprite, np.uint8), cv2.IMREAD_COLOR)
+    assert sheet.shape == (240, 1600, 3)
+    # Each tile holds its own frame (frames are filled with their frame number)
+    assert abs(int(sheet[180, 240].mean()) - 110) <= 3
+
+
+def test_sprite_sheet_skips_scenes_without_thumbnails():
+    analysis = {"scenes": [scene(0), scene(5), scene(9)]}
+    server.build_sprite_sheet("vid", analysis, capture([0, 9]))
+    assert analysis["sprite"]["columns"] == 2
+    assert "thumbnail" not in analysis["scenes"][1]
+    assert analysis["scenes"][2]["thumbnail"] == {"x": 160, "y": 0}
+
+
+def test_sprite_sheet_without_thumbnails():
+    analysis = {"scenes": [scene(0)]}
+    assert server.build_sprite_sheet("vid", analysis, {}) is None
+    assert "sprite" not in analysis
+
+
+@pytest.fixture
+def stored_sprite(monkeypatch):
+    monkeypatch.setattr(server, "sprite_cache", {})
+    analysis = {"scenes": [scene(0)]}
+    data = server.build_sprite_sheet("vid", analysis, capture([0]))
+    server.sprite_cache["vid"] = {"data": data, "format": "jpeg"}
+    return data
+
+
+def test_sprite_served_with_cache_headers(client, stored_sprite):
+    response = client.get("/api/analysis/vid/sprite")
+    assert response.status_code == 200
+    assert response.content == stored_sprite
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    
+    etag = response.headers["etag"]
+    response = client.get("/api/analysis/vid/sprite", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_sprite_media_type_follows_stored_format(client, stored_sprite, monkeypatch):
+    monkeypatch.setattr(server, "THUMBNAIL_FORMAT", "webp")
+    assert client.get("/api/analysis/vid/sprite").headers["content-type"] == "image/jpeg"
+    
+    server.sprite_cache["vid"]["format"] = "webp"
+    assert client.get("/api/analysis/vid/sprite").headers["content-type"] == "image/webp"
+
+
+def test_missing_sprite_returns_404(client, monkeypatch):
+    monkeypatch.setattr(server, "sprite_cache", {})
+    assert client.get("/api/analysis/nope/sprite").status_code == 404
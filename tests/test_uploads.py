@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import ClientDisconnect
+
+import server
+
+VIDEO = b"0123456789" * 10
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(server, "upload_sessions", {})
+    return tmp_path
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Replace video analysis with a stub that records the files it was given"""
+    calls = []
+    
+    def fake_analyze(video_path, **kwargs):
+        calls.append(video_path)
+        return {"total_frames": 1, "fps": 1.0, "duration_seconds": 1.0, "scenes": [], "inference_stats": {}}
+    monkeypatch.setattr(server, "analyze_video_frames", fake_analyze)
+    return calls
+
+
+def create(client, total_size=len(VIDEO)):
+    response = client.post("/api/uploads", json={
+        "filename": "recital.mp4", "content_type": "video/mp4", "total_size": total_size
+    })
+    assert response.status_code == 201
+    return response.json()["upload_id"]
+
+
+def patch(client, upload_id, offset, body, checksum=None):
+    headers = {"Upload-Offset": str(offset)}
+    if checksum:
+        headers["X-Chunk-SHA256"] = checksum
+    return client.patch(f"/api/uploads/{upload_id}", content=body, headers=headers)
+
+
+class DroppingRequest:
+    """Request whose body stream breaks off after some pieces, like a client losing Wi-Fi"""
+    
+    def __init__(self, pieces):
+        self.pieces = pieces
+    
+    async def stream(self):
+        for piece in self.pieces:
+            yield piece
+        raise ClientDisconnect()
+
+
+def test_create_returns_201_with_offset(client, upload_dir):
+    response = client.post("/api/uploads", json={
+        "filename": "../recital.mp4", "content_type": "video/mp4", "total_size": 10
+    })
+    assert response.status_code == 201
+    assert response.json()["offset"] == 0
+    assert response.headers["Upload-Offset"] == "0"
+    assert os.listdir(upload_dir) == [f"{response.json()['upload_id']}_recital.mp4"]
+
+
+def test_create_rejects_oversized_upload(client, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_MAX_BYTES", 10)
+    response = client.post("/api/uploads", json={
+        "filename": "recital.mp4", "content_type": "video/mp4", "total_size": 11
+    })
+    assert response.status_code == 413
+
+
+def test_chunks_append_and_report_offset(client):
+    upload_id = create(client)
+    assert patch(client, upload_id, 0, VIDEO[:40]).json()["offset"] == 40
+    response = patch(client, upload_id, 40, VIDEO[40:], hashlib.sha256(VIDEO[40:]).hexdigest())
+    assert response.json()["offset"] == len(VIDEO)
+    assert client.get(f"/api/uploads/{upload_id}").headers["Upload-Offset"] == str(len(VIDEO))
+
+
+def test_offset_mismatch_returns_409_with_current_offset(client):
+    upload_id = create(client)
+    patch(client, upload_id, 0, VIDEO[:40])
+    response = patch(client, upload_id, 10, VIDEO[10:50])
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "40"
+
+
+def test_bad_chunk_checksum_rolls_back(client):
+    upload_id = create(client)
+    patch(client, upload_id, 0, VIDEO[:40])
+    response = patch(client, upload_id, 40, VIDEO[40:80], hashlib.sha256(b"other").hexdigest())
+    assert response.status_code == 400
+    
+    session = server.upload_sessions[upload_id]
+    assert session["offset"] == 40
+    assert os.path.getsize(session["path"]) == 40
+    assert session["sha256"].hexdigest() == hashlib.sha256(VIDEO[:40]).hexdigest()
+
+
+def test_chunk_past_declared_size_returns_413_and_rolls_back(client):
+    upload_id = create(client)
+    patch(client, upload_id, 0, VIDEO[:40])
+    response = patch(client, upload_id, 40, VIDEO[40:] + b"extra")
+    assert response.status_code == 413
+    assert os.path.getsize(server.upload_sessions[upload_id]["path"]) == 40
+
+
+def test_disconnect_keeps_received_bytes(client):
+    upload_id = create(client)
+    request = DroppingRequest([VIDEO[:30], VIDEO[30:50]])
+    response = asyncio.run(server.upload_chunk(upload_id, request, upload_offset=0,
+                                               x_chunk_sha256=hashlib.sha256(VIDEO).hexdigest()))
+    assert response.headers["Upload-Offset"] == "50"
+    
+    session = server.upload_sessions[upload_id]
+    assert os.path.getsize(session["path"]) == 50
+    assert session["sha256"].hexdigest() == hashlib.sha256(VIDEO[:50]).hexdigest()
+    assert patch(client, upload_id, 50, VIDEO[50:]).json()["offset"] == len(VIDEO)
+
+
+def test_early_finalize_returns_409(client):
+    upload_id = create(client)
+    patch(client, upload_id, 0, VIDEO[:40])
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={})
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "40"
+
+
+def test_finalize_429_keeps_session_for_retry(client, controller, analyzed):
+    upload_id = create(client)
+    patch(client, upload_id, 0, VIDEO)
+    
+    controller.max_in_flight = 0
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert os.path.exists(server.upload_sessions[upload_id]["path"])
+    
+    controller.max_in_flight = 2
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={"sha256": hashlib.sha256(VIDEO).hexdigest()})
+    assert response.status_code == 200
+    assert response.json()["video_id"] == upload_id
+    assert upload_id not in server.upload_sessions
+    assert not os.path.exists(analyzed[0])
+    assert controller.in_flight == 0
+
+
+def test_finalize_with_wrong_checksum_discards_upload(client, controller, analyzed):
+    upload_id = create(client)
+    patch(client, upload_id, 0, VIDEO)
+    path = server.upload_sessions[upload_id]["path"]
+    response = client.post(f"/api/uploads/{upload_id}/finalize", json={"sha256": "0" * 64})
+    assert response.status_code == 400
+    assert upload_id not in server.upload_sessions
+    assert not os.path.exists(path)
+    assert analyzed == []
+
+
+def test_finalize_waiting_on_lock_sees_consumed_session(client, controller, analyzed):
+    upload_id = create(client)
+    patch(client, upload_id, 0, VIDEO)
+    session = server.upload_sessions[upload_id]
+    
+    async def race():
+        await session["lock"].acquire()
+        waiting = asyncio.create_task(server.finalize_upload(upload_id, server.FinalizeUploadRequest()))
+        await asyncio.sleep(0)
+        # Another finalize consumed the session while this one waited for the lock
+        server.upload_sessions.pop(upload_id)
+        session["lock"].release()
+        with pytest.raises(HTTPException) as excinfo:
+            await waiting
+        return excinfo.value.status_code
+    
+    assert asyncio.run(race()) == 404
+    assert analyzed == []
+    assert controller.in_flight == 0
+
+
+def test_gc_removes_expired_sessions_and_stale_orphans(client, upload_dir, monkeypatch):
+    upload_id = create(client)
+    expired_path = server.upload_sessions[upload_id]["path"]
+    server.upload_sessions[upload_id]["updated_at"] -= server.UPLOAD_SESSION_TTL_SECONDS + 1
+    
+    stale = upload_dir / "old_recital.mp4"
+    stale.write_bytes(b"partial")
+    old = time.time() - server.UPLOAD_SESSION_TTL_SECONDS - 1
+    os.utime(stale, (old, old))
+    fresh = upload_dir / "other_worker.mp4"
+    fresh.write_bytes(b"partial")
+    live_id = create(client)
+    
+    assert server.collect_abandoned_uploads() == 2
+    assert not os.path.exists(expired_path)
+    assert not stale.exists()
+    assert fresh.exists()
+    assert os.path.exists(server.upload_sessions[live_id]["path"])